@@ -3,18 +3,42 @@ from flask_socketio import SocketIO, emit, join_room, leave_room
 import os
 import threading
 import time
-import wave
+import itertools
+import logging
 import io
 import json
-from mutagen import File
-from mutagen.id3 import ID3NoHeaderError
 import base64
 import mimetypes
+from dvr import DVRBuffer
+from pcm import PCMPipeline, wave_header
+from metrics import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE
+from structured_log import setup_logging, log_event
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'votre_cle_secrete_ici'
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# Journal JSON lines écrit en tâche de fond; événements fréquents limités en débit
+setup_logging('audio_server.log', limits={
+    'client_connect': {'rate': 20, 'burst': 100},
+    'client_disconnect': {'rate': 20, 'burst': 100},
+})
+
+# Métriques exposées sur /metrics
+BYTES_SENT = Counter('audio_stream_bytes_sent_total', 'Octets envoyés à tous les auditeurs /stream')
+LISTENER_BYTES = Counter('audio_listener_bytes_sent_total', 'Octets envoyés par auditeur /stream actif', ['listener'])
+CHUNK_JITTER = Histogram('audio_chunk_production_lateness_seconds',
+                         'Retard de production des chunks par rapport au temps réel',
+                         buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+LISTENER_LAG = Histogram('audio_listener_lag_seconds', 'Retard des auditeurs sur le direct',
+                         buckets=(0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0))
+STREAM_CONNECTIONS = Gauge('audio_stream_connections', 'Connexions /stream actives')
+SOCKETIO_CONNECTIONS = Gauge('audio_socketio_connections', 'Clients Socket.IO connectés')
+TRACK_LOAD_SECONDS = Histogram('audio_track_load_seconds', 'Durée de load_current_track')
+STREAM_LOCK_WAIT = Histogram('audio_stream_lock_wait_seconds', "Temps d'attente sur stream_lock",
+                             buckets=(0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1))
+listener_ids = itertools.count(1)
+
 class AudioStreamer:
     def __init__(self):
         self.current_track = None
@@ -28,12 +52,46 @@ class AudioStreamer:
         self.stream_thread = None
         self.stream_lock = threading.Lock()
         self.track_changed = False
+        self.byte_rate = 16000
+        # Tampon time-shift des dernières minutes diffusées
+        self.dvr = DVRBuffer(os.environ.get('DVR_DIR', 'dvr'),
+                             window_seconds=int(os.environ.get('DVR_WINDOW', 600)))
+        # Pipeline PCM (normalisation + fondu enchaîné) pour les pistes WAV
+        self._pcm = None
+        self.crossfade_seconds = float(os.environ.get('CROSSFADE_SECONDS', 3))
+        self.pcm_params = None
+        self.pcm_tail = None
+        self.crossfade_at = None
         
-    def add_track(self, filepath):
+    @property
+    def pcm(self):
+        """Pipeline PCM créé au premier besoin (évite d'importer NumPy sans piste WAV)"""
+        if self._pcm is None:
+            self._pcm = PCMPipeline(cache_path=os.environ.get('PCM_CACHE', '.pcm_cache.json'))
+        return self._pcm
+
+    def warm_up(self, directory='uploads'):
+        """Préparer la bibliothèque et la première piste avant d'accepter du trafic"""
+        audio_extensions = ('.mp3', '.wav', '.flac', '.ogg', '.m4a')
+        if os.path.isdir(directory):
+            known = {track['filepath'] for track in self.playlist}
+            for filename in sorted(os.listdir(directory)):
+                filepath = os.path.join(directory, filename)
+                if filename.lower().endswith(audio_extensions) and filepath not in known:
+                    self.add_track(filepath, save_cache=False)
+        # Une seule écriture du cache pour toute la bibliothèque
+        if self._pcm is not None:
+            self._pcm.save_cache()
+        if self.playlist and not self.current_track:
+            self.load_current_track()
+
+    def add_track(self, filepath, save_cache=True):
         """Ajouter une piste à la playlist"""
         if os.path.exists(filepath):
             # Extraire les métadonnées
             try:
+                # Import différé: mutagen n'est chargé qu'au premier ajout de piste
+                from mutagen import File
                 audio_file = File(filepath)
                 metadata = {
                     'filepath': filepath,
@@ -41,7 +99,8 @@ class AudioStreamer:
                     'title': str(audio_file.get('TIT2', [os.path.basename(filepath)])[0]) if audio_file else os.path.basename(filepath),
                     'artist': str(audio_file.get('TPE1', ['Inconnu'])[0]) if audio_file else 'Inconnu',
                     'album': str(audio_file.get('TALB', ['Inconnu'])[0]) if audio_file else 'Inconnu',
-                    'duration': getattr(audio_file, 'info', {}).length if audio_file else 0
+                    'duration': getattr(audio_file, 'info', {}).length if audio_file else 0,
+                    'bitrate': getattr(getattr(audio_file, 'info', None), 'bitrate', 0)
                 }
             except:
                 metadata = {
@@ -50,46 +109,128 @@ class AudioStreamer:
                     'title': os.path.basename(filepath),
                     'artist': 'Inconnu',
                     'album': 'Inconnu',
-                    'duration': 0
+                    'duration': 0,
+                    'bitrate': 0
                 }
             
+            # Gain de normalisation calculé une seule fois à l'ajout. Un WAV que le
+            # module wave ne sait pas lire (extensible, flottant...) reste diffusé tel quel.
+            metadata['pcm'] = False
+            if PCMPipeline.is_supported(filepath):
+                try:
+                    metadata['gain'] = self.pcm.analyze(filepath)['gain']
+                    metadata['pcm'] = True
+                    if save_cache:
+                        self.pcm.save_cache()
+                except Exception as e:
+                    log_event('pcm_unsupported', "WAV non pris en charge par le pipeline PCM: %(error)s",
+                              logging.WARNING, filepath=filepath, error=e)
+            
             self.playlist.append(metadata)
             return True
         return False
     
-    def load_current_track(self):
+    def load_current_track(self, crossfade=False):
         """Charger la piste actuelle"""
         if self.playlist and 0 <= self.current_index < len(self.playlist):
             track = self.playlist[self.current_index]
+            load_start = time.perf_counter()
             try:
-                with open(track['filepath'], 'rb') as f:
-                    self.audio_data = f.read()
+                if track.get('pcm'):
+                    try:
+                        self._load_pcm_track(track, crossfade)
+                    except Exception as e:
+                        # Repli sur la diffusion brute plutôt que d'interrompre la lecture
+                        log_event('pcm_unsupported', "WAV non pris en charge par le pipeline PCM: %(error)s",
+                                  logging.WARNING, filepath=track['filepath'], error=e)
+                        track['pcm'] = False
+                        self._load_raw_track(track)
+                else:
+                    self._load_raw_track(track)
                 self.current_track = track
                 self.position = 0
+                # Débit en octets/s pour cadencer la diffusion en temps réel
+                if self.pcm_params:
+                    self.byte_rate = self.pcm_params[0] * self.pcm_params[1] * self.pcm_params[2]
+                elif track.get('bitrate'):
+                    self.byte_rate = track['bitrate'] / 8
+                elif track.get('duration'):
+                    self.byte_rate = len(self.audio_data) / track['duration']
+                else:
+                    self.byte_rate = 16000
                 self.track_changed = True
-                print(f"Piste chargée: {track['title']}")
+                TRACK_LOAD_SECONDS.observe(time.perf_counter() - load_start)
+                log_event('track_loaded', "Piste chargée: %(title)s",
+                          title=track['title'], index=self.current_index)
                 return True
             except Exception as e:
-                print(f"Erreur lors du chargement: {e}")
+                log_event('track_load_error', "Erreur lors du chargement: %(error)s",
+                          logging.ERROR, error=e)
                 return False
         return False
     
+    def _load_raw_track(self, track):
+        """Charger les octets du fichier tels quels"""
+        with open(track['filepath'], 'rb') as f:
+            self.audio_data = f.read()
+        self.pcm_params = self.pcm_tail = self.crossfade_at = None
+
+    def _load_pcm_track(self, track, crossfade):
+        """Charger une piste WAV normalisée, en fondu avec la fin de la précédente"""
+        params, samples = self.pcm.load(track['filepath'])
+        frame_bytes = params[0] * params[1]
+
+        if crossfade and self.pcm_tail is not None and params == self.pcm_params:
+            # Partie de la fin de piste précédente pas encore diffusée
+            remaining = max(0, (len(self.audio_data) - self.position) // frame_bytes)
+            samples = self.pcm.crossfade(self.pcm_tail[len(self.pcm_tail) - remaining:], samples)
+
+        # Trames PCM brutes: l'en-tête WAV est envoyé une seule fois par connexion
+        self.audio_data = self.pcm.encode(samples, params)
+        self.pcm_params = params
+
+        # Réserver la fin de piste pour le fondu avec la suivante
+        fade_frames = int(self.crossfade_seconds * params[2])
+        if fade_frames > 0 and len(samples) > 2 * fade_frames:
+            self.pcm_tail = samples[-fade_frames:].copy()
+            self.crossfade_at = len(self.audio_data) - fade_frames * frame_bytes
+        else:
+            self.pcm_tail = self.crossfade_at = None
+
+    def _crossfade_due(self):
+        """Le début du fondu est atteint et la piste suivante est compatible"""
+        if self.crossfade_at is None or self.position < self.crossfade_at or not self.playlist:
+            return False
+        following = self.playlist[(self.current_index + 1) % len(self.playlist)]
+        try:
+            return (following.get('pcm')
+                    and self.pcm.params(following['filepath']) == self.pcm_params)
+        except Exception:
+            return False
+
     def get_audio_chunk(self):
         """Obtenir le prochain chunk audio"""
+        wait_start = time.perf_counter()
         with self.stream_lock:
+            STREAM_LOCK_WAIT.observe(time.perf_counter() - wait_start)
             if self.audio_data and self.position < len(self.audio_data):
-                chunk = self.audio_data[self.position:self.position + self.chunk_size]
+                size = self.chunk_size
+                if self.pcm_params:
+                    # Chunks alignés sur les trames pour que le fondu reste aligné
+                    size -= size % (self.pcm_params[0] * self.pcm_params[1])
+                chunk = self.audio_data[self.position:self.position + size]
                 self.position += len(chunk)
                 return chunk
             return None
     
-    def next_track(self):
+    def next_track(self, crossfade=False):
         """Passer à la piste suivante"""
         if self.playlist:
             old_index = self.current_index
             self.current_index = (self.current_index + 1) % len(self.playlist)
-            if self.load_current_track():
-                print(f"Passage à la piste suivante: {old_index} -> {self.current_index}")
+            if self.load_current_track(crossfade):
+                log_event('track_next', "Passage à la piste suivante: %(old_index)s -> %(index)s",
+                          old_index=old_index, index=self.current_index)
                 return True
         return False
     
@@ -99,7 +240,8 @@ class AudioStreamer:
             old_index = self.current_index
             self.current_index = (self.current_index - 1) % len(self.playlist)
             if self.load_current_track():
-                print(f"Passage à la piste précédente: {old_index} -> {self.current_index}")
+                log_event('track_previous', "Passage à la piste précédente: %(old_index)s -> %(index)s",
+                          old_index=old_index, index=self.current_index)
                 return True
         return False
     
@@ -109,7 +251,8 @@ class AudioStreamer:
             old_index = self.current_index
             self.current_index = index
             if self.load_current_track():
-                print(f"Sélection de la piste: {old_index} -> {self.current_index}")
+                log_event('track_selected', "Sélection de la piste: %(old_index)s -> %(index)s",
+                          old_index=old_index, index=self.current_index)
                 return True
         return False
     
@@ -119,31 +262,55 @@ class AudioStreamer:
             self.stream_thread = threading.Thread(target=self._streaming_loop)
             self.stream_thread.daemon = True
             self.stream_thread.start()
-            print("Thread de streaming démarré")
+            log_event('streaming_started', "Thread de streaming démarré")
     
     def _streaming_loop(self):
         """Boucle principale de streaming"""
+        schedule_start = None
+        sent = 0
         while True:
             try:
                 if self.is_playing and self.current_track and self.audio_data:
                     # Vérifier si on a atteint la fin de la piste
-                    if self.position >= len(self.audio_data):
-                        print(f"Fin de piste atteinte: {self.current_track['title']}")
+                    if self.position >= len(self.audio_data) or self._crossfade_due():
+                        log_event('track_end', "Fin de piste atteinte: %(title)s",
+                                  title=self.current_track['title'])
                         # Passer automatiquement à la piste suivante
-                        if not self.next_track():
+                        if not self.next_track(crossfade=True):
                             # Si pas de piste suivante, arrêter la lecture
                             self.is_playing = False
                             socketio.emit('playback_state', {'is_playing': False})
                         continue
-                    
-                    # Attendre un peu pour simuler le streaming temps réel
-                    time.sleep(0.1)
+
+                    # Repartir d'un nouvel horaire à chaque changement de piste ou reprise
+                    if schedule_start is None or self.track_changed:
+                        self.track_changed = False
+                        schedule_start = time.time()
+                        sent = 0
+                        self.dvr.set_format(self.pcm_params)
+
+                    # Retard sur l'horaire temps réel prévu pour ce chunk
+                    lateness = time.time() - (schedule_start + sent / self.byte_rate)
+                    CHUNK_JITTER.observe(max(0.0, lateness))
+
+                    # Produire le chunk suivant dans le tampon DVR
+                    chunk = self.get_audio_chunk()
+                    if chunk:
+                        self.dvr.write(chunk)
+                        sent += len(chunk)
+
+                    # Cadencer la production sur le débit de la piste
+                    delay = schedule_start + sent / self.byte_rate - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
                 else:
                     # Pas de lecture en cours, attendre
+                    schedule_start = None
                     time.sleep(0.5)
                     
             except Exception as e:
-                print(f"Erreur dans la boucle de streaming: {e}")
+                log_event('streaming_error', "Erreur dans la boucle de streaming: %(error)s",
+                          logging.ERROR, error=e)
                 time.sleep(1)
 
 # Instance globale du streamer
@@ -215,30 +382,89 @@ def add_local_file():
     else:
         return jsonify({'error': 'Fichier non trouvé ou erreur'}), 400
 
+def stream_start(offset):
+    """Format du flux à offset, et offset aligné sur une trame PCM"""
+    if offset >= streamer.dvr.head:
+        # Les prochaines données produites seront au format de la piste actuelle
+        return offset, streamer.pcm_params
+    start, fmt = streamer.dvr.format_at(offset)
+    if fmt:
+        offset += (start - offset) % (fmt[0] * fmt[1])
+    return offset, fmt
+
 @app.route('/stream')
 def audio_stream():
-    """Stream audio principal"""
-    def generate_audio():
+    """Stream audio principal (?from=<secondes> pour reprendre dans le passé)"""
+    seconds_ago = request.args.get('from', type=float)
+    if seconds_ago:
+        offset = streamer.dvr.offset_at(seconds_ago)
+    else:
+        offset = streamer.dvr.head
+    offset, fmt = stream_start(offset)
+
+    listener_id = next(listener_ids)
+
+    def generate_audio(offset):
         # Démarrer le streaming si pas encore fait
         streamer.start_streaming()
+        STREAM_CONNECTIONS.inc()
+        listener_bytes = LISTENER_BYTES.labels(listener_id)
+
+        # Flux PCM: un seul en-tête WAV par connexion, puis des trames brutes
+        silence = b'\x00' * streamer.chunk_size
+        if fmt:
+            frame_bytes = fmt[0] * fmt[1]
+            silence_byte = b'\x80' if fmt[1] == 1 else b'\x00'
+            silence = silence_byte * (streamer.chunk_size - streamer.chunk_size % frame_bytes)
+            yield wave_header(*fmt)
         
-        while True:
-            if streamer.is_playing and streamer.current_track and streamer.audio_data:
-                chunk = streamer.get_audio_chunk()
+        try:
+            while True:
+                # Ne jamais envoyer sous l'en-tête de cette connexion des données d'un autre format:
+                # la réponse s'arrête à la frontière et la page recharge /stream
+                max_bytes = streamer.chunk_size
+                if offset < streamer.dvr.head:
+                    if streamer.dvr.format_at(offset)[1] != fmt:
+                        break
+                    boundary = streamer.dvr.next_format_change(offset)
+                    if boundary is not None:
+                        max_bytes = min(max_bytes, boundary - offset)
+
+                # Lire le tampon DVR à partir de la position de cet auditeur
+                chunk, read_offset = streamer.dvr.read(offset, max_bytes)
+                if read_offset != offset:
+                    # Auditeur rattrapé par la fin de la fenêtre: se réaligner sur une trame
+                    offset, _ = stream_start(read_offset)
+                    continue
                 if chunk:
+                    offset += len(chunk)
+                    BYTES_SENT.inc(len(chunk))
+                    listener_bytes.inc(len(chunk))
+                    LISTENER_LAG.observe((streamer.dvr.head - offset) / streamer.byte_rate)
                     yield chunk
+                elif streamer.is_playing and streamer.current_track and streamer.audio_data:
+                    # Attendre la production du prochain chunk sans bloquer le hub eventlet,
+                    # avec un réveil par chunk produit plutôt qu'une scrutation fixe
+                    period = min(1.0, streamer.chunk_size / streamer.byte_rate)
+                    streamer.dvr.wait(offset, max(0.1, period), sleep=socketio.sleep, interval=period)
                 else:
-                    # Attendre le changement de piste
-                    time.sleep(0.1)
-            else:
-                # Envoyer des données vides quand pas de lecture
-                yield b'\x00' * streamer.chunk_size
-                time.sleep(0.1)
+                    # Envoyer des données vides quand pas de lecture
+                    yield silence
+                    socketio.sleep(0.1)
+        finally:
+            # Auditeur déconnecté
+            STREAM_CONNECTIONS.dec()
+            LISTENER_BYTES.remove(listener_id)
     
-    return Response(generate_audio(), 
-                   mimetype='audio/mpeg',
+    return Response(generate_audio(offset), 
+                   mimetype='audio/wav' if fmt else 'audio/mpeg',
                    headers={'Cache-Control': 'no-cache'})
 
+@app.route('/metrics')
+def metrics():
+    """Métriques au format Prometheus"""
+    return Response(REGISTRY.expose(), content_type=CONTENT_TYPE)
+
 # Routes de contrôle
 @app.route('/api/play')
 def play():
@@ -255,7 +481,8 @@ def play():
             'index': streamer.current_index,
             'is_playing': True
         })
-        print(f"ADMIN: Lecture démarrée: {streamer.current_track['title']}")
+        log_event('admin_play', "ADMIN: Lecture démarrée: %(title)s",
+                  title=streamer.current_track['title'])
         return jsonify({'success': True, 'track': streamer.current_track})
     else:
         return jsonify({'error': 'Aucune piste à lire'}), 400
@@ -266,7 +493,7 @@ def pause():
     streamer.is_playing = False
     # Forcer tous les clients à se mettre en pause
     socketio.emit('admin_pause', {'is_playing': False})
-    print("ADMIN: Lecture mise en pause")
+    log_event('admin_pause', "ADMIN: Lecture mise en pause")
     return jsonify({'success': True})
 
 @app.route('/api/next')
@@ -279,7 +506,8 @@ def next_track():
             'index': streamer.current_index,
             'is_playing': streamer.is_playing
         })
-        print(f"ADMIN: Piste suivante: {streamer.current_track['title']}")
+        log_event('admin_next', "ADMIN: Piste suivante: %(title)s",
+                  title=streamer.current_track['title'])
         return jsonify({'success': True, 'track': streamer.current_track})
     return jsonify({'error': 'Aucune piste suivante'}), 400
 
@@ -293,7 +521,8 @@ def previous_track():
             'index': streamer.current_index,
             'is_playing': streamer.is_playing
         })
-        print(f"ADMIN: Piste précédente: {streamer.current_track['title']}")
+        log_event('admin_previous', "ADMIN: Piste précédente: %(title)s",
+                  title=streamer.current_track['title'])
         return jsonify({'success': True, 'track': streamer.current_track})
     return jsonify({'error': 'Aucune piste précédente'}), 400
 
@@ -307,7 +536,8 @@ def select_track(index):
             'index': streamer.current_index,
             'is_playing': streamer.is_playing
         })
-        print(f"ADMIN: Piste sélectionnée: {streamer.current_track['title']}")
+        log_event('admin_select', "ADMIN: Piste sélectionnée: %(title)s",
+                  title=streamer.current_track['title'], index=index)
         return jsonify({'success': True, 'track': streamer.current_track})
     return jsonify({'error': 'Index invalide'}), 400
 
@@ -317,7 +547,7 @@ def stop():
     streamer.is_playing = False
     streamer.position = 0
     socketio.emit('playback_state', {'is_playing': False})
-    print("Lecture arrêtée")
+    log_event('playback_stopped', "Lecture arrêtée")
     return jsonify({'success': True})
 
 # WebSocket events
@@ -325,6 +555,7 @@ def stop():
 def on_connect():
     """Nouveau client connecté"""
     streamer.clients.add(request.sid)
+    SOCKETIO_CONNECTIONS.set(len(streamer.clients))
     emit('connected', {
         'message': 'Connecté au serveur audio',
         'current_track': streamer.current_track,
@@ -332,13 +563,16 @@ def on_connect():
         'current_index': streamer.current_index,
         'playlist': streamer.playlist
     })
-    print(f"Client connecté: {request.sid} (Total: {len(streamer.clients)})")
+    log_event('client_connect', "Client connecté: %(sid)s (Total: %(total)s)",
+              sid=request.sid, total=len(streamer.clients))
 
 @socketio.on('disconnect')
 def on_disconnect():
     """Client déconnecté"""
     streamer.clients.discard(request.sid)
-    print(f"Client déconnecté: {request.sid} (Total: {len(streamer.clients)})")
+    SOCKETIO_CONNECTIONS.set(len(streamer.clients))
+    log_event('client_disconnect', "Client déconnecté: %(sid)s (Total: %(total)s)",
+              sid=request.sid, total=len(streamer.clients))
 
 @socketio.on('join_room')
 def on_join_room(data):
@@ -357,12 +591,26 @@ def on_request_sync():
         'playlist': streamer.playlist
     })
 
-if __name__ == '__main__':
+def warm_up():
+    """Phase de préparation: bibliothèque, première piste et templates"""
+    start = time.perf_counter()
+    streamer.warm_up('uploads')
+    # Compiler les templates Jinja pour que la première requête ne paie pas ce coût
+    with app.test_request_context():
+        render_template('index.html')
+        render_template('admin.html')
+    log_event('server_ready', "Serveur prêt en %(seconds).3fs",
+              seconds=time.perf_counter() - start, tracks=len(streamer.playlist))
+
+def main():
+    """Démarrer le serveur après la phase de préparation"""
     # Créer les dossiers nécessaires
     os.makedirs('templates', exist_ok=True)
     os.makedirs('static', exist_ok=True)
     os.makedirs('uploads', exist_ok=True)
 
+    warm_up()
+
     print("=" * 50)
     print("🎵 SERVEUR DE DIFFUSION AUDIO DÉMARRÉ")
     print("=" * 50)
@@ -374,4 +622,7 @@ if __name__ == '__main__':
     # Pour Render, récupérer le port via l'environnement
     port = int(os.environ.get('PORT', 5000))
     socketio.run(app, host='0.0.0.0', port=port)
-    print(f"Serveur démarré sur le port {port}")
\ No newline at end of file
+    print(f"Serveur démarré sur le port {port}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Banc de charge pour le serveur de streaming audio
+Simule de nombreux auditeurs /stream et clients Socket.IO à partir de client.py
+et écrit les résultats en JSON pour comparer les versions
+
+Chaque client simulé est un thread système avec des appels requests bloquants.
+Les clients sont répartis sur plusieurs processus (--workers) pour que la
+contention du GIL côté client ne domine pas le TTFB et la gigue mesurés.
+Au-delà de quelques centaines de clients par processus, les mesures reflètent
+surtout le banc lui-même: comparer uniquement des résultats obtenus avec la
+même répartition (enregistrée dans config).
+"""
+
+import argparse
+import bisect
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+from client import AudioStreamClient
+
+# Au-delà, la contention du GIL côté client fausse les mesures
+MAX_CLIENTS_PER_WORKER = 500
+
+ADMIN_COMMANDS = {
+    'next': AudioStreamClient.next_track,
+    'previous': AudioStreamClient.previous_track,
+    'play': AudioStreamClient.play,
+    'pause': AudioStreamClient.pause,
+    'playlist': AudioStreamClient.get_playlist,
+}
+
+
+def percentiles(values):
+    """Résumé statistique d'une série de mesures"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+    n = len(ordered)
+
+    def rank(p):
+        return ordered[min(n - 1, max(0, int(round(p / 100 * n)) - 1))]
+
+    return {
+        'count': n,
+        'mean': sum(ordered) / n,
+        'min': ordered[0],
+        'p50': rank(50),
+        'p90': rank(90),
+        'p99': rank(99),
+        'max': ordered[-1],
+    }
+
+
+class ListenerStats:
+    def __init__(self):
+        self.ttfb = []
+        self.reconnect = []
+        self.bytes = 0
+        # Octets reçus après le premier chunk de chaque connexion, seuls couverts par streaming_time
+        self.timed_bytes = 0
+        self.streaming_time = 0.0
+        self.max_gap = 0.0
+        # Variance des écarts entre chunks (Welford) pour ne pas garder chaque écart
+        self.gap_count = 0
+        self.gap_mean = 0.0
+        self.gap_m2 = 0.0
+        self.errors = 0
+
+    def add_gap(self, gap):
+        self.gap_count += 1
+        delta = gap - self.gap_mean
+        self.gap_mean += delta / self.gap_count
+        self.gap_m2 += delta * (gap - self.gap_mean)
+        self.max_gap = max(self.max_gap, gap)
+
+    @property
+    def jitter(self):
+        return (self.gap_m2 / self.gap_count) ** 0.5 if self.gap_count > 1 else 0.0
+
+    @property
+    def bitrate(self):
+        return self.timed_bytes * 8 / self.streaming_time if self.streaming_time > 0 else 0.0
+
+    def summary(self):
+        """Résumé transmissible entre processus"""
+        return {
+            'ttfb': self.ttfb,
+            'reconnect': self.reconnect,
+            'bytes': self.bytes,
+            'bitrate': self.bitrate if self.streaming_time else None,
+            'jitter': self.jitter if self.gap_count > 1 else None,
+            'max_gap': self.max_gap if self.gap_count else None,
+            'errors': self.errors,
+        }
+
+
+def run_listener(server_url, stop_event, stats, reconnect_interval, timeout):
+    """Auditeur /stream simulé, avec reconnexion périodique optionnelle"""
+    client = AudioStreamClient(server_url)
+    disconnected_at = None
+
+    while not stop_event.is_set():
+        start = time.time()
+        first = None
+        last = None
+        try:
+            with client.open_stream(timeout=timeout) as response:
+                for chunk in response.iter_content(chunk_size=4096):
+                    now = time.time()
+                    if first is None:
+                        first = last = now
+                        stats.ttfb.append(now - start)
+                        if disconnected_at is not None:
+                            stats.reconnect.append(now - disconnected_at)
+                    else:
+                        stats.add_gap(now - last)
+                        stats.timed_bytes += len(chunk)
+                        last = now
+                    stats.bytes += len(chunk)
+                    if stop_event.is_set() or (reconnect_interval and now - first >= reconnect_interval):
+                        break
+            disconnected_at = time.time()
+        except requests.exceptions.RequestException:
+            stats.errors += 1
+            disconnected_at = None
+            stop_event.wait(1)
+        finally:
+            # Octets comptés même si le flux est interrompu: garder le temps correspondant
+            if first is not None:
+                stats.streaming_time += last - first
+
+
+class SocketIOStats:
+    def __init__(self):
+        self.connect = []
+        self.events = []
+        self.errors = 0
+
+
+def run_socketio_client(server_url, stop_event, stats, timeout):
+    """Client Socket.IO simulé: temps de connexion et réception des diffusions admin"""
+    import socketio
+
+    sio = socketio.Client(reconnection=False)
+    connected = threading.Event()
+
+    @sio.on('connected')
+    def on_connected(data):
+        connected.set()
+
+    @sio.on('admin_track_change')
+    def on_track_change(data):
+        stats.events.append(time.time())
+
+    start = time.time()
+    try:
+        sio.connect(server_url, wait_timeout=timeout)
+        if connected.wait(timeout):
+            stats.connect.append(time.time() - start)
+        stop_event.wait()
+    except Exception:
+        stats.errors += 1
+    finally:
+        sio.disconnect()
+
+
+def run_admin(server_url, stop_event, commands, interval, latencies, errors, sent_times, timeout):
+    """Envoie périodiquement des commandes admin et mesure leur latence
+
+    Une commande qui dépasse timeout compte comme une erreur, avec son temps écoulé.
+    """
+    client = AudioStreamClient(server_url, timeout=timeout)
+    i = 0
+    while not stop_event.wait(interval):
+        name = commands[i % len(commands)]
+        i += 1
+        start = time.time()
+        ok = ADMIN_COMMANDS[name](client)
+        latencies.setdefault(name, []).append(time.time() - start)
+        if not ok:
+            errors[name] = errors.get(name, 0) + 1
+        elif name in ('next', 'previous'):
+            sent_times.append(start)
+
+
+def broadcast_latencies(sent_times, socketio_stats):
+    """Délai entre l'envoi d'une commande admin et sa réception par chaque client"""
+    latencies = []
+    for stats in socketio_stats:
+        for received in stats['events']:
+            i = bisect.bisect_right(sent_times, received) - 1
+            if i >= 0:
+                latencies.append(received - sent_times[i])
+    return latencies
+
+
+def start_threads(count, ramp, target, args_for):
+    """Démarrer count threads en étalant les connexions sur ramp secondes"""
+    threads = []
+    for i in range(count):
+        thread = threading.Thread(target=target, args=args_for(i))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+        if ramp and count:
+            time.sleep(ramp / count)
+    return threads
+
+
+def run_worker(url, listeners, socketio_clients, duration, ramp, reconnect_interval, timeout):
+    """Processus de charge: lance ses clients puis retourne leurs résumés"""
+    # Pile réduite pour supporter des centaines de threads par processus
+    threading.stack_size(512 * 1024)
+
+    stop_event = threading.Event()
+    listener_stats = [ListenerStats() for _ in range(listeners)]
+    socketio_stats = [SocketIOStats() for _ in range(socketio_clients)]
+
+    started = time.time()
+    threads = start_threads(listeners, ramp, run_listener,
+                            lambda i: (url, stop_event, listener_stats[i], reconnect_interval, timeout))
+    threads += start_threads(socketio_clients, ramp, run_socketio_client,
+                             lambda i: (url, stop_event, socketio_stats[i], timeout))
+
+    remaining = duration - (time.time() - started)
+    if remaining > 0:
+        time.sleep(remaining)
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=timeout)
+
+    return {
+        'listeners': [stats.summary() for stats in listener_stats],
+        'socketio': [vars(stats) for stats in socketio_stats],
+    }
+
+
+def split(count, parts):
+    """Répartir count clients sur parts processus"""
+    return [count // parts + (1 if i < count % parts else 0) for i in range(parts)]
+
+
+def run_benchmark(args):
+    """Exécuter le banc de charge et retourner les résultats"""
+    admin_latencies = {}
+    admin_errors = {}
+    sent_times = []
+
+    control = AudioStreamClient(args.url)
+    if not control.check_connection():
+        raise SystemExit(f"❌ Serveur injoignable: {args.url}")
+    if args.play:
+        control.play()
+
+    workers = max(1, min(args.workers, args.listeners + args.socketio))
+    per_worker = list(zip(split(args.listeners, workers), split(args.socketio, workers)))
+    busiest = max(l + s for l, s in per_worker)
+    if busiest > MAX_CLIENTS_PER_WORKER:
+        print(f"⚠️  {busiest} clients par processus: augmentez --workers pour des mesures fiables")
+
+    print(f"🚀 {args.listeners} auditeurs /stream, {args.socketio} clients Socket.IO, "
+          f"{workers} processus, {args.duration}s")
+
+    # Les commandes admin sont envoyées depuis le processus principal
+    stop_event = threading.Event()
+    admin = threading.Thread(target=run_admin,
+                             args=(args.url, stop_event, args.admin_commands.split(','),
+                                   args.admin_interval, admin_latencies, admin_errors, sent_times,
+                                   args.timeout))
+    admin.daemon = True
+    admin.start()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_worker, args.url, listeners, socketio_clients, args.duration,
+                               args.ramp, args.reconnect_interval, args.timeout)
+                   for listeners, socketio_clients in per_worker]
+        results = [future.result() for future in futures]
+
+    stop_event.set()
+    # Chaque commande est bornée par args.timeout: au plus une en cours
+    admin.join(timeout=args.timeout + 1)
+    if admin.is_alive():
+        print("⚠️  Commande admin toujours en cours: sa latence n'est pas comptée")
+
+    listener_stats = [stats for result in results for stats in result['listeners']]
+    socketio_stats = [stats for result in results for stats in result['socketio']]
+
+    def collect(key):
+        return [stats[key] for stats in listener_stats if stats[key] is not None]
+
+    return {
+        'label': args.label,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {
+            'url': args.url,
+            'listeners': args.listeners,
+            'socketio': args.socketio,
+            'duration': args.duration,
+            'ramp': args.ramp,
+            'reconnect_interval': args.reconnect_interval,
+            'admin_commands': args.admin_commands,
+            'admin_interval': args.admin_interval,
+            'client_model': 'threads',
+            'workers': workers,
+            'max_clients_per_worker': busiest,
+        },
+        'environment': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'stream': {
+            'ttfb_seconds': percentiles([t for stats in listener_stats for t in stats['ttfb']]),
+            'reconnect_seconds': percentiles([t for stats in listener_stats for t in stats['reconnect']]),
+            'bitrate_bps': percentiles(collect('bitrate')),
+            'jitter_seconds': percentiles(collect('jitter')),
+            'max_gap_seconds': percentiles(collect('max_gap')),
+            'bytes_total': sum(stats['bytes'] for stats in listener_stats),
+            'errors': sum(stats['errors'] for stats in listener_stats),
+        },
+        'socketio': {
+            'connect_seconds': percentiles([t for stats in socketio_stats for t in stats['connect']]),
+            'broadcast_latency_seconds': percentiles(broadcast_latencies(sent_times, socketio_stats)),
+            'errors': sum(stats['errors'] for stats in socketio_stats),
+        },
+        'admin': {name: percentiles(values) for name, values in admin_latencies.items()},
+        'admin_errors': admin_errors,
+    }
+
+
+def compare(results, baseline):
+    """Afficher l'évolution des médianes et p99 par rapport à une référence"""
+    print(f"\n📊 Comparaison avec {baseline.get('label') or 'la référence'}")
+    for section in ('stream', 'socketio', 'admin'):
+        for name, summary in results.get(section, {}).items():
+            old = baseline.get(section, {}).get(name)
+            if not isinstance(summary, dict) or not isinstance(old, dict):
+                continue
+            for key in ('p50', 'p99'):
+                if key in summary and old.get(key):
+                    change = (summary[key] - old[key]) / old[key] * 100
+                    print(f"   {section}.{name}.{key}: {old[key]:.4g} -> {summary[key]:.4g} ({change:+.1f}%)")
+
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Banc de charge du serveur de streaming audio")
+    parser.add_argument('--url', default="http://localhost:5000")
+    parser.add_argument('--listeners', type=int, default=100, help="auditeurs /stream simulés")
+    parser.add_argument('--socketio', type=int, default=100, help="clients Socket.IO simulés")
+    parser.add_argument('--duration', type=float, default=30, help="durée de la mesure en secondes")
+    parser.add_argument('--ramp', type=float, default=5, help="étalement des connexions en secondes")
+    parser.add_argument('--reconnect-interval', type=float, default=0,
+                        help="reconnecter chaque auditeur toutes les N secondes (0 = jamais)")
+    parser.add_argument('--admin-commands', default="next,playlist",
+                        help=f"commandes admin à mesurer parmi {','.join(ADMIN_COMMANDS)}")
+    parser.add_argument('--admin-interval', type=float, default=2)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processus clients (voir MAX_CLIENTS_PER_WORKER)")
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--play', action='store_true', help="lancer la lecture avant la mesure")
+    parser.add_argument('--label', default="", help="étiquette de version enregistrée dans les résultats")
+    parser.add_argument('--output', default="bench_results.json")
+    parser.add_argument('--baseline', help="résultats JSON d'une version précédente à comparer")
+    args = parser.parse_args()
+
+    for name in args.admin_commands.split(','):
+        if name not in ADMIN_COMMANDS:
+            parser.error(f"commande admin inconnue: {name}")
+
+    results = run_benchmark(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Résultats écrits dans {args.output}")
+
+    stream = results['stream']
+    print(f"   TTFB p50: {stream['ttfb_seconds'].get('p50', 0):.3f}s"
+          f"  débit p50: {stream['bitrate_bps'].get('p50', 0) / 1000:.1f} kb/s"
+          f"  erreurs: {stream['errors']}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,11 @@ import time
 import os
 
 class AudioStreamClient:
-    def __init__(self, server_url="http://localhost:5000"):
+    def __init__(self, server_url="http://localhost:5000", timeout=None):
         self.server_url = server_url
         self.session = requests.Session()
+        # Délai des requêtes de contrôle (None = pas de limite)
+        self.timeout = timeout
         self.is_playing = False
         self.current_track = None
         self.playlist = []
@@ -27,7 +29,7 @@ class AudioStreamClient:
     def get_playlist(self):
         """Obtenir la playlist actuelle"""
         try:
-            response = self.session.get(f"{self.server_url}/api/playlist")
+            response = self.session.get(f"{self.server_url}/api/playlist", timeout=self.timeout)
             if response.status_code == 200:
                 data = response.json()
                 self.playlist = data.get('playlist', [])
@@ -41,7 +43,7 @@ class AudioStreamClient:
     def play(self):
         """Démarrer la lecture"""
         try:
-            response = self.session.get(f"{self.server_url}/api/play")
+            response = self.session.get(f"{self.server_url}/api/play", timeout=self.timeout)
             return response.status_code == 200
         except requests.exceptions.RequestException as e:
             print(f"Erreur play: {e}")
@@ -50,7 +52,7 @@ class AudioStreamClient:
     def pause(self):
         """Mettre en pause"""
         try:
-            response = self.session.get(f"{self.server_url}/api/pause")
+            response = self.session.get(f"{self.server_url}/api/pause", timeout=self.timeout)
             return response.status_code == 200
         except requests.exceptions.RequestException as e:
             print(f"Erreur pause: {e}")
@@ -59,7 +61,7 @@ class AudioStreamClient:
     def next_track(self):
         """Piste suivante"""
         try:
-            response = self.session.get(f"{self.server_url}/api/next")
+            response = self.session.get(f"{self.server_url}/api/next", timeout=self.timeout)
             return response.status_code == 200
         except requests.exceptions.RequestException as e:
             print(f"Erreur next: {e}")
@@ -68,7 +70,7 @@ class AudioStreamClient:
     def previous_track(self):
         """Piste précédente"""
         try:
-            response = self.session.get(f"{self.server_url}/api/previous")
+            response = self.session.get(f"{self.server_url}/api/previous", timeout=self.timeout)
             return response.status_code == 200
         except requests.exceptions.RequestException as e:
             print(f"Erreur previous: {e}")
@@ -77,7 +79,7 @@ class AudioStreamClient:
     def select_track(self, index):
         """Sélectionner une piste"""
         try:
-            response = self.session.get(f"{self.server_url}/api/select/{index}")
+            response = self.session.get(f"{self.server_url}/api/select/{index}", timeout=self.timeout)
             return response.status_code == 200
         except requests.exceptions.RequestException as e:
             print(f"Erreur select: {e}")
@@ -87,18 +89,25 @@ class AudioStreamClient:
         """Ajouter un fichier local"""
         try:
             data = {"filepath": filepath}
-            response = self.session.post(f"{self.server_url}/api/add_local", json=data)
+            response = self.session.post(f"{self.server_url}/api/add_local", json=data, timeout=self.timeout)
             return response.status_code == 200
         except requests.exceptions.RequestException as e:
             print(f"Erreur add_local: {e}")
             return False
     
-    def download_stream(self, output_file="stream_output.mp3", duration=30):
-        """Télécharger le stream audio pendant une durée donnée"""
+    def open_stream(self, from_seconds=None, timeout=None):
+        """Ouvrir une connexion /stream (réponse en mode streaming)"""
+        params = {'from': from_seconds} if from_seconds else None
+        return self.session.get(f"{self.server_url}/stream", params=params,
+                                stream=True, timeout=timeout)
+    
+    def download_stream(self, output_file="stream_output.mp3", duration=30, from_seconds=None):
+        """Télécharger le stream audio pendant une durée donnée
+        from_seconds: démarrer l'enregistrement N secondes dans le passé (tampon DVR)"""
         try:
             print(f"📡 Enregistrement du stream pendant {duration}s dans {output_file}...")
             
-            response = self.session.get(f"{self.server_url}/stream", stream=True, timeout=duration+5)
+            response = self.open_stream(from_seconds, timeout=duration+5)
             
             start_time = time.time()
             with open(output_file, 'wb') as f:
@@ -238,7 +247,9 @@ def main():
                 output_file = input("Nom du fichier de sortie (par défaut stream_output.mp3): ").strip()
                 if output_file == "":
                     output_file = "stream_output.mp3"
-                client.download_stream(output_file=output_file, duration=duration)
+                from_str = input("Démarrer il y a combien de secondes (par défaut direct): ").strip()
+                from_seconds = int(from_str) if from_str.isdigit() else None
+                client.download_stream(output_file=output_file, duration=duration, from_seconds=from_seconds)
             
             elif choice == "9":
                 if client.get_playlist():
@@ -0,0 +1,193 @@
+"""
+Tampon DVR (time-shift) pour le serveur de streaming audio
+Conserve les dernières minutes de diffusion dans des segments projetés en mémoire (mmap)
+"""
+
+import bisect
+import mmap
+import os
+import threading
+import time
+
+
+class DVRSegment:
+    def __init__(self, directory, segment_id, start_offset, size):
+        self.segment_id = segment_id
+        self.start_offset = start_offset
+        self.size = size
+        self.length = 0
+        # Index temporel: horodatage et offset global de chaque écriture
+        self.times = []
+        self.offsets = []
+        self.filepath = os.path.join(directory, f"segment_{segment_id:08d}.seg")
+
+        # Fichier pré-alloué à taille fixe puis projeté en mémoire
+        with open(self.filepath, 'wb') as f:
+            f.truncate(size)
+        self.file = open(self.filepath, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), size)
+
+    @property
+    def end_offset(self):
+        return self.start_offset + self.length
+
+    @property
+    def free(self):
+        return self.size - self.length
+
+    def write(self, data, timestamp):
+        """Écrire des données à la fin du segment"""
+        self.times.append(timestamp)
+        self.offsets.append(self.end_offset)
+        self.mm[self.length:self.length + len(data)] = data
+        self.length += len(data)
+
+    def read(self, offset, max_bytes):
+        """Lire jusqu'à max_bytes à partir d'un offset global"""
+        start = offset - self.start_offset
+        end = min(self.length, start + max_bytes)
+        return self.mm[start:end]
+
+    def offset_at(self, timestamp):
+        """Premier offset écrit à partir de l'horodatage donné"""
+        i = bisect.bisect_left(self.times, timestamp)
+        if i >= len(self.offsets):
+            return self.end_offset
+        return self.offsets[i]
+
+    def close(self):
+        """Libérer la projection et supprimer le fichier"""
+        self.mm.close()
+        self.file.close()
+        try:
+            os.remove(self.filepath)
+        except OSError:
+            pass
+
+
+class DVRBuffer:
+    def __init__(self, directory='dvr', window_seconds=600, segment_size=1024 * 1024):
+        self.directory = directory
+        self.window_seconds = window_seconds
+        self.segment_size = segment_size
+        self.segments = []
+        self.next_segment_id = 0
+        self.head = 0
+        self.last_write = 0.0
+        # Changements de format du flux: (offset de début, format) par ordre croissant
+        self.formats = []
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        # L'index est en mémoire: les segments d'une exécution précédente sont inutilisables
+        for filename in os.listdir(directory):
+            if filename.endswith('.seg'):
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except OSError:
+                    pass
+
+    def write(self, data, timestamp=None):
+        """Ajouter des données diffusées au tampon"""
+        if not data:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self.lock:
+            view = memoryview(data)
+            while view:
+                if not self.segments or self.segments[-1].free == 0:
+                    self.segments.append(DVRSegment(self.directory, self.next_segment_id,
+                                                    self.head, self.segment_size))
+                    self.next_segment_id += 1
+                segment = self.segments[-1]
+                n = min(len(view), segment.free)
+                segment.write(view[:n], timestamp)
+                self.head += n
+                view = view[n:]
+            self.last_write = timestamp
+
+            self._trim(timestamp)
+
+    def set_format(self, fmt):
+        """Déclarer le format des prochaines données écrites (None = octets bruts)"""
+        with self.lock:
+            if not self.formats or self.formats[-1][1] != fmt:
+                if self.formats and self.formats[-1][0] == self.head:
+                    self.formats[-1] = (self.head, fmt)
+                else:
+                    self.formats.append((self.head, fmt))
+
+    def format_at(self, offset):
+        """(offset de début, format) de la section contenant offset"""
+        with self.lock:
+            # Peu d'entrées, et les lecteurs sont en général sur la plus récente
+            for start, fmt in reversed(self.formats):
+                if start <= offset:
+                    return start, fmt
+            return 0, None
+
+    def next_format_change(self, offset):
+        """Offset du prochain changement de format après offset (None si aucun)"""
+        with self.lock:
+            for start, _ in self.formats:
+                if start > offset:
+                    return start
+            return None
+
+    def oldest_offset(self):
+        """Plus ancien offset encore disponible"""
+        with self.lock:
+            return self.segments[0].start_offset if self.segments else self.head
+
+    def offset_at(self, seconds_ago):
+        """Offset correspondant à la diffusion d'il y a seconds_ago secondes"""
+        target = time.time() - max(0, seconds_ago)
+        with self.lock:
+            for segment in self.segments:
+                if segment.times and segment.times[-1] >= target:
+                    return segment.offset_at(target)
+            return self.head
+
+    def read(self, offset, max_bytes):
+        """Lire à partir d'un offset, retourne (données, offset effectif)"""
+        with self.lock:
+            # Un lecteur trop en retard reprend au début de la fenêtre
+            if self.segments and offset < self.segments[0].start_offset:
+                offset = self.segments[0].start_offset
+            # Les lecteurs sont en général proches du direct: chercher depuis la fin
+            for segment in reversed(self.segments):
+                if segment.start_offset <= offset < segment.end_offset:
+                    return segment.read(offset, max_bytes), offset
+            return b'', offset
+
+    def wait(self, offset, timeout, sleep=time.sleep, interval=0.02):
+        """Attendre que des données soient disponibles après offset
+
+        sleep doit être coopératif (ex: socketio.sleep) quand l'appelant est une
+        greenlet: un verrou ou une condition système bloquerait tout le hub.
+        interval est la période de production des chunks: le réveil est calé sur
+        la prochaine écriture attendue plutôt que sur une scrutation fixe.
+        """
+        deadline = time.time() + timeout
+        while offset >= self.head:
+            now = time.time()
+            remaining = deadline - now
+            if remaining <= 0:
+                return False
+            delay = self.last_write + interval * 1.05 - now
+            if delay <= 0:
+                # Producteur en retard sur son horaire: réessayer plus souvent
+                delay = interval / 4
+            sleep(min(delay, remaining))
+        return True
+
+    def _trim(self, now):
+        """Supprimer les segments sortis de la fenêtre (appelé sous verrou)"""
+        limit = now - self.window_seconds
+        while len(self.segments) > 1 and self.segments[0].times[-1] < limit:
+            self.segments.pop(0).close()
+        oldest = self.segments[0].start_offset
+        while len(self.formats) > 1 and self.formats[1][0] <= oldest:
+            self.formats.pop(0)
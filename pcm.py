@@ -0,0 +1,185 @@
+"""
+Pipeline PCM pour les pistes WAV du serveur de streaming audio
+Normalisation du volume (RMS/crête) calculée à l'ajout et fondu enchaîné entre pistes
+"""
+
+import json
+import os
+import threading
+import wave
+
+
+def _numpy():
+    """Import différé de NumPy: seules les pistes WAV en ont besoin (démarrage rapide)"""
+    import numpy
+    return numpy
+
+
+class PCMPipeline:
+    def __init__(self, target_rms_db=-18.0, peak_ceiling_db=-1.0, block_frames=1 << 18, cache_path=None):
+        self.target_rms = 10 ** (target_rms_db / 20)
+        self.peak_ceiling = 10 ** (peak_ceiling_db / 20)
+        self.block_frames = block_frames
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+        self.cache_path = cache_path
+        self.cache_dirty = False
+        self.save_lock = threading.Lock()
+        if cache_path:
+            self._load_cache()
+
+    def _load_cache(self):
+        """Relire les analyses persistées lors d'une exécution précédente"""
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for entry in entries:
+            key = (entry['filepath'], entry['mtime'], entry['size'])
+            self.cache[key] = {'params': tuple(entry['params']), 'rms': entry['rms'],
+                               'peak': entry['peak'], 'gain': entry['gain']}
+
+    def save_cache(self):
+        """Persister les analyses pour éviter de les refaire au redémarrage"""
+        if not self.cache_path:
+            return
+        with self.save_lock:
+            with self.cache_lock:
+                if not self.cache_dirty:
+                    return
+                entries = [dict(info, filepath=key[0], mtime=key[1], size=key[2])
+                           for key, info in self.cache.items()]
+                self.cache_dirty = False
+            # Écriture atomique: un arrêt pendant l'écriture ne corrompt pas le cache
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.cache_path)
+
+    @staticmethod
+    def is_supported(filepath):
+        """Seules les sources WAV passent par le pipeline PCM"""
+        return bool(filepath) and filepath.lower().endswith('.wav')
+
+    def analyze(self, filepath):
+        """Calculer (ou relire du cache) le RMS, la crête et le gain d'une piste"""
+        stat = os.stat(filepath)
+        key = (filepath, stat.st_mtime, stat.st_size)
+        with self.cache_lock:
+            if key in self.cache:
+                return self.cache[key]
+
+        np = _numpy()
+
+        sum_squares = 0.0
+        peak = 0.0
+        count = 0
+        with wave.open(filepath, 'rb') as wf:
+            params = (wf.getnchannels(), wf.getsampwidth(), wf.getframerate())
+            # Analyse par blocs pour ne pas décoder toute la piste d'un coup
+            while True:
+                data = wf.readframes(self.block_frames)
+                if not data:
+                    break
+                block = self.decode(data, params)
+                sum_squares += float(np.square(block, dtype=np.float64).sum())
+                peak = max(peak, float(np.abs(block).max()))
+                count += block.size
+
+        rms = (sum_squares / count) ** 0.5 if count else 0.0
+        if rms > 0 and peak > 0:
+            gain = min(self.target_rms / rms, self.peak_ceiling / peak)
+        else:
+            gain = 1.0
+
+        info = {'params': params, 'rms': rms, 'peak': peak, 'gain': gain}
+        with self.cache_lock:
+            self.cache[key] = info
+            self.cache_dirty = True
+        return info
+
+    def params(self, filepath):
+        """(canaux, largeur d'échantillon, fréquence) d'une piste WAV"""
+        return self.analyze(filepath)['params']
+
+    def load(self, filepath):
+        """Décoder une piste WAV en float32 (frames, canaux) avec le gain appliqué"""
+        np = _numpy()
+        info = self.analyze(filepath)
+        with wave.open(filepath, 'rb') as wf:
+            data = wf.readframes(wf.getnframes())
+        samples = self.decode(data, info['params'])
+        samples *= np.float32(info['gain'])
+        return info['params'], samples
+
+    @staticmethod
+    def crossfade(tail, head):
+        """Mixer la fin de la piste précédente avec le début de la suivante"""
+        np = _numpy()
+        n = min(len(tail), len(head))
+        if n == 0:
+            return head
+        # Fondu à puissance constante calculé sur tout le bloc
+        t = np.linspace(0.0, np.pi / 2, n, dtype=np.float32)[:, None]
+        mixed = np.empty_like(head)
+        np.multiply(tail[-n:], np.cos(t), out=mixed[:n])
+        mixed[:n] += head[:n] * np.sin(t)
+        mixed[n:] = head[n:]
+        return mixed
+
+    @staticmethod
+    def decode(data, params):
+        """Octets PCM entrelacés -> float32 dans [-1, 1)"""
+        np = _numpy()
+        nchannels, sampwidth, _ = params
+        if sampwidth == 1:
+            samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+        elif sampwidth == 2:
+            samples = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768
+        elif sampwidth == 3:
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+            # Extension de signe sur 24 bits
+            ints = (ints << 8) >> 8
+            samples = ints.astype(np.float32) / 8388608
+        elif sampwidth == 4:
+            samples = np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648
+        else:
+            raise ValueError(f"Largeur d'échantillon non supportée: {sampwidth}")
+        return samples.reshape(-1, nchannels)
+
+    @staticmethod
+    def encode(samples, params):
+        """float32 -> octets PCM entrelacés"""
+        np = _numpy()
+        _, sampwidth, _ = params
+        flat = samples.ravel()
+        if sampwidth == 1:
+            return (np.clip(flat * 128 + 128, 0, 255)).astype(np.uint8).tobytes()
+        if sampwidth == 2:
+            return np.clip(flat * 32768, -32768, 32767).astype('<i2').tobytes()
+        scale = float(2 ** (8 * sampwidth - 1))
+        ints = np.clip(flat.astype(np.float64) * scale, -scale, scale - 1).astype('<i4')
+        if sampwidth == 3:
+            return ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        return ints.tobytes()
+
+
+def wave_header(nchannels, sampwidth, framerate, data_size=None):
+    """En-tête RIFF/WAVE canonique de 44 octets
+
+    data_size=None produit un en-tête de flux de longueur inconnue.
+    """
+    block_align = nchannels * sampwidth
+    riff_size = 0xFFFFFFFF if data_size is None else 36 + data_size
+    if data_size is None:
+        data_size = 0xFFFFFFFF
+    return b''.join([
+        b'RIFF', riff_size.to_bytes(4, 'little'), b'WAVE',
+        b'fmt ', (16).to_bytes(4, 'little'), (1).to_bytes(2, 'little'),
+        nchannels.to_bytes(2, 'little'), framerate.to_bytes(4, 'little'),
+        (framerate * block_align).to_bytes(4, 'little'), block_align.to_bytes(2, 'little'),
+        (sampwidth * 8).to_bytes(2, 'little'),
+        b'data', data_size.to_bytes(4, 'little'),
+    ])
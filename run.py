@@ -8,6 +8,10 @@ import os
 import sys
 import subprocess
 import platform
+import hashlib
+from importlib import metadata
+
+REQUIREMENTS_STAMP = '.requirements.sha256'
 
 def check_python_version():
     """Vérifier la version de Python"""
@@ -18,11 +22,42 @@ def check_python_version():
     print(f"✅ Python {version.major}.{version.minor}.{version.micro}")
     return True
 
+def requirements_hash():
+    """Empreinte de requirements.txt pour l'interpréteur courant"""
+    digest = hashlib.sha256(sys.executable.encode())
+    with open('requirements.txt', 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+def requirements_up_to_date():
+    """Vérifier si requirements.txt correspond à l'installation précédente"""
+    try:
+        with open(REQUIREMENTS_STAMP, encoding='utf-8') as f:
+            if f.read().strip() != requirements_hash():
+                return False
+    except OSError:
+        return False
+
+    # Contrôler aussi que les versions épinglées sont toujours installées
+    with open('requirements.txt', encoding='utf-8') as f:
+        for line in f:
+            name, sep, version = line.strip().partition('==')
+            if not sep:
+                continue
+            try:
+                if metadata.version(name) != version:
+                    return False
+            except metadata.PackageNotFoundError:
+                return False
+    return True
+
 def install_requirements():
     """Installer les dépendances"""
     print("📦 Installation des dépendances...")
     try:
         subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
+        with open(REQUIREMENTS_STAMP, 'w', encoding='utf-8') as f:
+            f.write(requirements_hash())
         print("✅ Dépendances installées")
         return True
     except subprocess.CalledProcessError:
@@ -116,9 +151,12 @@ def main():
     
     create_directories()
     
-    # Installation des dépendances
+    # Installation des dépendances (ignorée si requirements.txt n'a pas changé)
     if os.path.exists('requirements.txt'):
-        install_requirements()
+        if requirements_up_to_date():
+            print("✅ Dépendances à jour")
+        else:
+            install_requirements()
     
     create_template_files()
     check_audio_files()
@@ -129,9 +167,10 @@ def main():
     try:
         print("\n🎵 Démarrage du serveur Flask...")
         
-        # Importer et démarrer l'application
+        # Importer et démarrer l'application (préparation avant ouverture du port)
         if os.path.exists('app.py'):
             import app
+            app.main()
         else:
             print("❌ Fichier app.py non trouvé!")
             print("ℹ️  Copiez le code du serveur Flask dans un fichier 'app.py'")
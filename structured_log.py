@@ -0,0 +1,135 @@
+"""
+Journalisation structurée non bloquante pour le serveur de streaming audio
+Les événements passent par une file et sont écrits en JSON lines par un thread de fond
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger('audio_server')
+_limiter = None
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'event': getattr(record, 'event', record.name),
+            'message': record.getMessage(),
+        }
+        # Champs de l'appelant imbriqués: ils ne peuvent pas écraser ts/level/event/message
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry['fields'] = fields
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class EventRateLimiter:
+    """Échantillonnage et limitation de débit par type d'événement
+
+    limits: {event: {'sample': fraction conservée, 'rate': événements/s, 'burst': rafale}}
+    """
+    def __init__(self, limits):
+        self.limits = limits
+        self.buckets = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def allow(self, event):
+        """Retourne (autorisé, nombre d'événements écartés depuis le dernier autorisé)"""
+        limit = self.limits.get(event)
+        if limit is None:
+            return True, 0
+
+        with self.lock:
+            sample = limit.get('sample', 1.0)
+            allowed = sample >= 1.0 or random.random() < sample
+
+            rate = limit.get('rate')
+            if allowed and rate:
+                # Seau à jetons par événement
+                now = time.monotonic()
+                burst = limit.get('burst', rate)
+                tokens, last = self.buckets.get(event, (burst, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                allowed = tokens >= 1
+                self.buckets[event] = (tokens - 1 if allowed else tokens, now)
+
+            if not allowed:
+                self.suppressed[event] = self.suppressed.get(event, 0) + 1
+                return False, 0
+            return True, self.suppressed.pop(event, 0)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui abandonne les événements si la file est pleine"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Le formatage est fait par le thread de fond, pas sur le chemin critique
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(filepath='audio_server.log', limits=None, queue_size=10000, console=True):
+    """Configurer le logger: file bornée + thread d'écriture JSON lines"""
+    global _limiter
+    file_handler = logging.FileHandler(filepath, encoding='utf-8')
+    file_handler.setFormatter(JSONFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(message)s'))
+        handlers.append(console_handler)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    _limiter = EventRateLimiter(limits or {})
+
+    logger.handlers = [queue_handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def log_event(event, message='', level=logging.INFO, /, **fields):
+    """Journaliser un événement structuré (non bloquant)
+
+    message est un format %-style sur les champs, ex: "Client connecté: %(sid)s".
+    Il n'est mis en forme que par le thread d'écriture, et seulement si
+    l'événement passe la limitation de débit.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    suppressed = 0
+    if _limiter is not None:
+        # Écarter avant de construire l'enregistrement pour borner le coût
+        allowed, suppressed = _limiter.allow(event)
+        if not allowed:
+            return
+    extra = {'event': event, 'fields': fields, 'suppressed': suppressed}
+    if fields:
+        logger.log(level, message, fields, extra=extra)
+    else:
+        logger.log(level, message, extra=extra)